@@ -1,16 +1,45 @@
+import io
 import os
+import re
+import asyncio
+import json
 import sys
+import hashlib
+import sqlite3
 import time
-import html
-import smtplib
-from email.message import EmailMessage
+import functools
+import heapq
+import threading
+from collections import deque
+from contextlib import closing
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from zoneinfo import ZoneInfo
-from openai import OpenAI
+from openai import AsyncOpenAI
 EASTERN = ZoneInfo("America/New_York")
 
+# orjson is much faster on large Petfinder pages; fall back to the stdlib if it's missing
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps_key(obj) -> bytes:
+        """Stable (sorted-key) serialization for hashing into cache keys."""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps_key(obj) -> bytes:
+        """Stable (sorted-key) serialization for hashing into cache keys."""
+        return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
 
 # --------------------
 # Config & constants
@@ -64,13 +93,49 @@ EXCLUDED_BREEDS = {
     "Great Pyrenees",
     "Boxer",
     "Hound",
-    "American Bulldog"
-    
+    "American Bulldog",
 }
+# Single alternation, longest names first, so one scan covers every banned breed
+_EXCLUDED_RE = re.compile(
+    "|".join(map(re.escape, sorted(EXCLUDED_BREEDS, key=len, reverse=True))),
+    re.IGNORECASE,
+)
 
 PETFINDER_TOKEN_URL = "https://api.petfinder.com/v2/oauth2/token"
 PETFINDER_ANIMALS_URL = "https://api.petfinder.com/v2/animals"
 
+# On-disk state shared across scheduled runs
+CACHE_DIR = os.path.expanduser(os.getenv("DOGFINDER_CACHE_DIR", "~/.cache/dogfinder"))
+
+# Tokens last ~1h; cache them on disk so back-to-back runs skip the OAuth call
+# abspath so a bare filename still has a directory for save_cached_token to create
+TOKEN_CACHE_PATH = os.path.abspath(os.path.expanduser(
+    os.getenv("PETFINDER_TOKEN_CACHE", os.path.join(CACHE_DIR, "token.json"))
+))
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+_TOKEN_LOCK = threading.Lock()
+
+# Short-lived cache of search result pages; stale entries are kept for a day
+# as a fallback when Petfinder is returning 5xx errors
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+RESPONSE_CACHE_TTL_SECONDS = 300
+RESPONSE_CACHE_MAX_STALE_SECONDS = 24 * 3600
+
+# Search parameters shared by every zip and page
+SEARCH_PARAMS = {
+    "type": "dog",
+    "status": "adoptable",
+    "distance": DISTANCE_MILES,
+    "age": "young,baby",  # Petfinder valid values: baby, young, adult, senior
+    "sort": "recent",
+    "limit": "100",
+}
+
+# Concurrency limits for Petfinder requests
+MAX_CONCURRENT_REQUESTS = 8   # in-flight requests across all zips
+PAGE_WORKERS = 4              # concurrent page fetches per zip once total_pages is known
+_REQUEST_SLOTS = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+
 # Only consider last 24h
 NOW_UTC = datetime.now(timezone.utc)
 CUTOFF_UTC = NOW_UTC - timedelta(hours=6)
@@ -79,8 +144,56 @@ CUTOFF_UTC = NOW_UTC - timedelta(hours=6)
 # Utilities
 # --------------------
 
-def get_token() -> str:
-    resp = requests.post(
+def load_cached_token():
+    """Return the cached access token if it is valid for a while longer, else None."""
+    try:
+        with open(TOKEN_CACHE_PATH) as f:
+            cached = json.load(f)
+        if cached["expires_at"] - time.time() > TOKEN_REFRESH_MARGIN_SECONDS:
+            return cached["access_token"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+def save_cached_token(token: str, expires_in: int):
+    # Write to a temp file and rename so a concurrent reader never sees half a file
+    tmp_path = f"{TOKEN_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_PATH), exist_ok=True)
+        # Owner-only on local disk; file modes don't survive the CI cache (see README)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"access_token": token, "expires_at": time.time() + expires_in}, f)
+        os.replace(tmp_path, TOKEN_CACHE_PATH)
+    except OSError as e:
+        print(f"Could not cache Petfinder token: {str(e)}")
+
+def clear_cached_token():
+    try:
+        os.remove(TOKEN_CACHE_PATH)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Could not clear cached Petfinder token: {str(e)}")
+
+def make_session() -> requests.Session:
+    """Session with a pooled, keep-alive adapter that retries rate limits and 5xx with backoff."""
+    retries = Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,  # hand the last response back so raise_for_status reports it
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+def get_token(session) -> str:
+    cached = load_cached_token()
+    if cached:
+        return cached
+    resp = session.post(
         PETFINDER_TOKEN_URL,
         data={
             "grant_type": "client_credentials",
@@ -90,7 +203,10 @@ def get_token() -> str:
         timeout=30,
     )
     resp.raise_for_status()
-    return resp.json()["access_token"]
+    payload = resp.json()
+    token = payload["access_token"]
+    save_cached_token(token, payload.get("expires_in") or 3600)
+    return token
 
 def safe_lower(s):
     return s.lower() if isinstance(s, str) else ""
@@ -104,29 +220,29 @@ def to_eastern_str(dt: datetime) -> str:
 
 
 def breed_excluded(breeds_obj: dict) -> bool:
-    names = []
-    if isinstance(breeds_obj, dict):
-        for key in ("primary", "secondary"):
-            val = breeds_obj.get(key)
-            if isinstance(val, str) and val.strip():
-                names.append(val.strip())
-    text = " ".join(names)
-    low = text.lower()
-    for banned in EXCLUDED_BREEDS:
-        if banned.lower() in low:
+    if not isinstance(breeds_obj, dict):
+        return False
+    for key in ("primary", "secondary"):
+        val = breeds_obj.get(key)
+        if isinstance(val, str) and _EXCLUDED_RE.search(val):
             return True
     return False
 
+# fromisoformat accepts "Z" and "+0000" offsets natively from 3.11
+_NATIVE_ISO = sys.version_info >= (3, 11)
+
+@functools.lru_cache(maxsize=4096)
 def parse_dt(dt_str: str):
     try:
-        return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+        if not _NATIVE_ISO:
+            if dt_str.endswith("Z"):
+                dt_str = dt_str[:-1] + "+00:00"
+            elif dt_str[-5:-4] in ("+", "-") and dt_str[-4:].isdigit():
+                dt_str = dt_str[:-2] + ":" + dt_str[-2:]  # "+0000" -> "+00:00"
+        return datetime.fromisoformat(dt_str)
     except Exception:
         return None
 
-def within_24_hours(published_at_str: str) -> bool:
-    dt = parse_dt(published_at_str)
-    return bool(dt and dt >= CUTOFF_UTC)
-
 def get_dog_preferences() -> str:
     """Define your dog preferences criteria for OpenAI analysis."""
     return """
@@ -140,6 +256,181 @@ def get_dog_preferences() -> str:
     - Personality: Playful, affectionate, trainable
     """
 
+# Dogs per OpenAI prompt; bigger digests are shortlisted chunk by chunk first
+OPENAI_CHUNK_SIZE = 20
+OPENAI_MAX_CONCURRENCY = 5
+TOP_DOGS_COUNT = 5
+# Recommendations for an identical set of dogs are reused for one cron interval
+RECOMMENDATION_CACHE_DIR = os.path.join(CACHE_DIR, "openai")
+RECOMMENDATION_CACHE_TTL_SECONDS = 6 * 3600
+OPENAI_SYSTEM_PROMPT = (
+    "You are a helpful assistant that analyzes dog adoption listings and provides recommendations based on specific criteria. "
+    # Dog data is sent as compact JSON with one-letter keys to save prompt tokens
+    "Dog data is JSON with short keys: i=id, n=name, b=breeds, s=size, a=age, g=gender, d=description."
+)
+
+def dog_summary(animal) -> dict:
+    """The subset of an Animal sent to OpenAI, keyed per the legend in OPENAI_SYSTEM_PROMPT."""
+    return {
+        "n": animal.name or "Unknown",
+        "b": animal.breeds,
+        "s": animal.size or "Unknown",
+        "a": animal.age or "Unknown",
+        "g": animal.gender or "Unknown",
+        "d": animal.description[:500],
+    }
+
+def dogs_json(dog_data: list) -> str:
+    return json.dumps(dog_data, separators=(",", ":"), ensure_ascii=False)
+
+def response_content(response):
+    """Return the first choice's message text, or None if the response has none."""
+    if not response or not hasattr(response, 'choices') or not response.choices:
+        return None
+    if not response.choices[0] or not hasattr(response.choices[0], 'message'):
+        return None
+    return response.choices[0].message.content or None
+
+async def shortlist_chunk(client, slots: asyncio.Semaphore, chunk: list) -> list:
+    """Ask OpenAI for the best few dogs in one chunk; returns the chosen Animals."""
+    dog_data = [{"i": i, **dog_summary(a)} for i, a in enumerate(chunk)]
+    prompt = f"""
+    Based on the following dog preferences:
+    {get_dog_preferences()}
+
+    From these {len(dog_data)} dogs, pick up to {TOP_DOGS_COUNT} that best match the criteria.
+    Respond with a JSON object of the form {{"ids": [<id>, ...]}} and nothing else.
+
+    Dog data:
+    {dogs_json(dog_data)}
+    """
+    async with slots:
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=100,
+            temperature=0.2
+        )
+    try:
+        ids = json.loads(response_content(response) or "")["ids"]
+        # The model may repeat an id; keep each dog once, in the order given
+        picked = [chunk[i] for i in dict.fromkeys(ids) if isinstance(i, int) and 0 <= i < len(chunk)]
+    except (ValueError, KeyError, TypeError):
+        picked = []
+    # Keep the newest dogs rather than losing the whole chunk on a bad reply
+    return picked[:TOP_DOGS_COUNT] or chunk[:TOP_DOGS_COUNT]
+
+async def recommend_top_dogs(client, animals: list):
+    """Ask OpenAI to pick and explain the top dogs among at most one chunk of candidates.
+
+    Returns the recommendation HTML, or None if the response had no content.
+    """
+    dog_data = [dog_summary(a) for a in animals]
+
+    # Create prompt for OpenAI
+    preferences = get_dog_preferences()
+    prompt = f"""
+    Based on the following dog preferences:
+    {preferences}
+    
+    Analyze these {len(dog_data)} dogs and select the top {TOP_DOGS_COUNT} that best match the criteria. 
+    For each selected dog, provide:
+    1. Dog's name and breed
+    2. Brief reason why this dog is a good match
+    3. Any concerns or considerations
+    
+    Dog data:
+    {dogs_json(dog_data)}
+    
+    IMPORTANT: Return ONLY clean HTML without any markdown formatting, code blocks, or backticks. 
+    Use proper HTML tags like <ul>, <li>, <strong>, <p>, etc.
+    Do not wrap the response in ```html or any other markdown syntax.
+    """
+    
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=1000,
+        temperature=0.7
+    )
+    
+    # Robust error handling for OpenAI response
+    content = response_content(response)
+    if not content:
+        return None
+    
+    # Clean up any markdown formatting that might have slipped through
+    content = content.strip()
+    if content.startswith("```html"):
+        content = content[7:]  # Remove ```html
+    if content.startswith("```"):
+        content = content[3:]   # Remove ```
+    if content.endswith("```"):
+        content = content[:-3]  # Remove trailing ```
+    content = content.strip()
+    
+    return content
+
+async def analyze_dogs_async(animals: list):
+    # Initialize OpenAI client with explicit parameters to avoid proxy issues.
+    # The HTTP client is scoped to this event loop and closed when the analysis
+    # ends, so its pooled connections never outlive the loop that opened them.
+    import httpx
+    async with httpx.AsyncClient(
+        proxies=None,
+        limits=httpx.Limits(max_keepalive_connections=OPENAI_MAX_CONCURRENCY),
+    ) as http_client:
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=30.0, http_client=http_client)
+
+        # Map: shortlist every chunk concurrently until one prompt's worth is left
+        slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        candidates = list(animals)
+        while len(candidates) > OPENAI_CHUNK_SIZE:
+            chunks = [candidates[i:i + OPENAI_CHUNK_SIZE] for i in range(0, len(candidates), OPENAI_CHUNK_SIZE)]
+            shortlists = await asyncio.gather(*[shortlist_chunk(client, slots, c) for c in chunks])
+            candidates = [a for shortlist in shortlists for a in shortlist]
+
+        # Reduce: one call picks and explains the overall top dogs
+        return await recommend_top_dogs(client, candidates)
+
+def recommendation_cache_path(animals: list) -> str:
+    """Cache file for this exact set of dogs and preferences."""
+    key_src = json_dumps_key({"ids": sorted(a.id for a in animals), "preferences": get_dog_preferences()})
+    key = hashlib.sha1(key_src).hexdigest()
+    return os.path.join(RECOMMENDATION_CACHE_DIR, f"{key}.html")
+
+def load_cached_recommendation(path: str):
+    try:
+        if time.time() - os.path.getmtime(path) < RECOMMENDATION_CACHE_TTL_SECONDS:
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+def save_cached_recommendation(path: str, content: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        # Drop expired entries so the restored cache directory doesn't grow forever
+        now = time.time()
+        for name in os.listdir(RECOMMENDATION_CACHE_DIR):
+            old_path = os.path.join(RECOMMENDATION_CACHE_DIR, name)
+            if now - os.path.getmtime(old_path) >= RECOMMENDATION_CACHE_TTL_SECONDS:
+                os.remove(old_path)
+    except OSError as e:
+        print(f"Could not cache OpenAI recommendations: {str(e)}")
+
 def analyze_dogs_with_openai(animals: list) -> str:
     """Use OpenAI to analyze dogs and generate top recommendations."""
     if not OPENAI_API_KEY:
@@ -148,157 +439,213 @@ def analyze_dogs_with_openai(animals: list) -> str:
     if not animals:
         return "No dogs available for analysis."
     
+    cache_path = recommendation_cache_path(animals)
+    cached = load_cached_recommendation(cache_path)
+    if cached is not None:
+        return cached
+
     try:
-        # Initialize OpenAI client with explicit parameters to avoid proxy issues
-        import httpx
-        client = OpenAI(
-            api_key=OPENAI_API_KEY,
-            timeout=30.0,
-            http_client=httpx.Client(proxies=None)
-        )
-        
-        # Prepare dog data for analysis
-        dog_data = []
-        for animal in animals[:20]:  # Limit to first 20 dogs to avoid token limits
-            if not animal or not isinstance(animal, dict):
-                continue
-            dog_info = {
-                "name": animal.get("name", "Unknown"),
-                "breeds": f"{animal.get('breeds', {}).get('primary', '')} {animal.get('breeds', {}).get('secondary', '')}".strip(),
-                "size": animal.get("size", "Unknown"),
-                "age": animal.get("age", "Unknown"),
-                "gender": animal.get("gender", "Unknown"),
-                "description": str(animal.get("description", ""))[:500],  # Ensure string and limit length
-                "url": animal.get("url", "")
-            }
-            dog_data.append(dog_info)
-        
-        if not dog_data:
-            return "No valid dog data available for analysis."
-        
-        # Create prompt for OpenAI
-        preferences = get_dog_preferences()
-        prompt = f"""
-        Based on the following dog preferences:
-        {preferences}
-        
-        Analyze these {len(dog_data)} dogs and select the top 5 that best match the criteria. 
-        For each selected dog, provide:
-        1. Dog's name and breed
-        2. Brief reason why this dog is a good match
-        3. Any concerns or considerations
-        
-        Dog data:
-        {str(dog_data)}
-        
-        IMPORTANT: Return ONLY clean HTML without any markdown formatting, code blocks, or backticks. 
-        Use proper HTML tags like <ul>, <li>, <strong>, <p>, etc.
-        Do not wrap the response in ```html or any other markdown syntax.
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that analyzes dog adoption listings and provides recommendations based on specific criteria."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.7
-        )
-        
-        # Robust error handling for OpenAI response
-        if not response or not hasattr(response, 'choices') or not response.choices:
-            return "OpenAI API returned an empty or invalid response."
-        
-        if not response.choices[0] or not hasattr(response.choices[0], 'message'):
-            return "OpenAI API response missing message content."
-        
-        content = response.choices[0].message.content
-        if not content:
-            return "OpenAI API returned empty content."
-        
-        # Clean up any markdown formatting that might have slipped through
-        content = content.strip()
-        if content.startswith("```html"):
-            content = content[7:]  # Remove ```html
-        if content.startswith("```"):
-            content = content[3:]   # Remove ```
-        if content.endswith("```"):
-            content = content[:-3]  # Remove trailing ```
-        content = content.strip()
-        
-        return content
-        
+        content = asyncio.run(analyze_dogs_async(animals))
     except Exception as e:
         return f"Error analyzing dogs with OpenAI: {str(e)}"
+    if not content:
+        return "OpenAI API returned an empty or invalid response."
+
+    save_cached_recommendation(cache_path, content)
+    return content
+
+@dataclass(frozen=True, slots=True)
+class Animal:
+    """The fields of a Petfinder listing the digest uses, extracted once at ingest."""
+    id: int
+    name: str
+    breeds: str
+    size: str
+    age: str
+    gender: str
+    description: str
+    url: str
+    photo_thumb: str
+    photo_full: str
+    published: datetime
+
+    @classmethod
+    def from_api(cls, a: dict, published: datetime) -> "Animal":
+        desc = a.get("description") or ""
+        thumb, full = pick_photo(a)
+        return cls(
+            id=a["id"],
+            name=a.get("name") or "",
+            breeds=join_breeds(a.get("breeds") or {}),
+            size=a.get("size") or "",
+            age=a.get("age") or "",
+            gender=a.get("gender") or "",
+            description=_WS_RE.sub(" ", str(desc)).strip(),
+            url=a.get("url") or "",
+            photo_thumb=thumb or "",
+            photo_full=full or "",
+            published=published,
+        )
+
+def open_response_cache() -> sqlite3.Connection:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(RESPONSE_CACHE_PATH, timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, body BLOB, expires_at REAL)")
+    return conn
+
+def response_cache_key(params: dict) -> str:
+    return hashlib.sha1(json_dumps_key(params)).hexdigest()
 
-def collect_animals_for_zip(session, token: str, zip_code: str):
+def cache_get(key: str, allow_stale: bool = False):
+    """Return the cached body for key, or None if missing (or expired, unless allow_stale)."""
+    try:
+        with closing(open_response_cache()) as conn:
+            row = conn.execute("SELECT body, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Response cache unavailable: {str(e)}")
+        return None
+    if row and (allow_stale or row[1] > time.time()):
+        return row[0]
+    return None
+
+def cache_put(key: str, body: bytes):
+    now = time.time()
+    try:
+        with closing(open_response_cache()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, body, expires_at) VALUES (?, ?, ?)",
+                (key, body, now + RESPONSE_CACHE_TTL_SECONDS),
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (now - RESPONSE_CACHE_MAX_STALE_SECONDS,))
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not write response cache: {str(e)}")
+
+def refresh_token(session, rejected_auth: str):
+    """Swap a rejected token for a fresh one, once, however many threads saw the 401."""
+    with _TOKEN_LOCK:
+        if session.headers.get("Authorization") == rejected_auth:
+            clear_cached_token()
+            # Don't send the rejected token along with the token request
+            del session.headers["Authorization"]
+            session.headers["Authorization"] = f"Bearer {get_token(session)}"
+
+def fetch_page(session, params: dict) -> dict:
+    """GET one page of Petfinder results, served from the response cache when fresh.
+
+    The session adapter handles retries; if Petfinder still fails with a 5xx,
+    a stale cached copy of the page is used instead when there is one.
+    """
+    key = response_cache_key(params)
+    body = cache_get(key)
+    if body is not None:
+        return json_loads(body)
+
+    sent_auth = session.headers.get("Authorization")
+    with _REQUEST_SLOTS:
+        r = session.get(PETFINDER_ANIMALS_URL, params=params, timeout=30)
+    if r.status_code == 401:
+        # A cached token can be revoked before its expiry; refetch it once
+        refresh_token(session, sent_auth)
+        with _REQUEST_SLOTS:
+            r = session.get(PETFINDER_ANIMALS_URL, params=params, timeout=30)
+    if r.status_code >= 500:
+        body = cache_get(key, allow_stale=True)
+        if body is not None:
+            print(f"Petfinder returned {r.status_code} for zip {params.get('location')}; using cached page {params.get('page')}.")
+            return json_loads(body)
+    r.raise_for_status()
+    cache_put(key, r.content)
+    return json_loads(r.content)
+
+def recent_prefix(animals: list):
+    """Split a page at the cutoff; returns (recent_animals, reached_cutoff).
+
+    Results come back newest first (sort=recent), so the page is cut at the
+    first listing published before the cutoff. Listings whose published_at is
+    missing, malformed or has no UTC offset are dropped here: they can't be
+    placed in the newest-first order fetch_all_animals merges on.
+    """
+    recent = []
+    for a in animals:
+        pub = parse_dt(a.get("published_at", ""))
+        if pub is None or pub.tzinfo is None:
+            continue
+        if pub < CUTOFF_UTC:
+            return recent, True
+        recent.append(a)
+    return recent, False
+
+def extend_recent(results: list, payload: dict) -> bool:
+    """Add a page's in-window animals to results; False once the cutoff is reached."""
+    animals = payload.get("animals", []) or []
+    recent, reached_cutoff = recent_prefix(animals)
+    results.extend(recent)
+    return bool(animals) and not reached_cutoff
+
+def collect_animals_for_zip(session, zip_code: str):
     results = []
-    page = 1
-    headers = {"Authorization": f"Bearer {token}"}
-    while True:
-        params = {
-        "type": "dog",
-        "status": "adoptable",
-        "location": zip_code,
-        "distance": DISTANCE_MILES,
-        "age": "young,baby",  # Petfinder valid values: baby, young, adult, senior
-        "sort": "recent",
-        "limit": "100",
-        "page": str(page),
-}
-        try:
-            r = session.get(PETFINDER_ANIMALS_URL, headers=headers, params=params, timeout=30)
-            r.raise_for_status()
-            payload = r.json()
-            animals = payload.get("animals", []) or []
-            if not animals:
-                break
-
-            last_published = parse_dt(animals[-1].get("published_at", "")) if animals else None
-            results.extend(animals)
-
-            pagination = payload.get("pagination") or {}
-            total_pages = pagination.get("total_pages") or page
-            if page >= total_pages:
-                break
-            if last_published and last_published < CUTOFF_UTC:
-                break
-
-            page += 1
-            time.sleep(0.3)
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 502:
-                print(f"Petfinder API temporarily unavailable (502 error) for zip {zip_code}. Skipping this zip code.")
-                break
-            else:
-                print(f"HTTP error {e.response.status_code} for zip {zip_code}. Skipping this zip code.")
-                break
-        except Exception as e:
-            print(f"Error fetching data for zip {zip_code}: {str(e)}. Skipping this zip code.")
-            break
+    base_params = {**SEARCH_PARAMS, "location": zip_code}
+    try:
+        # Page 1 tells us how many pages there are; the rest are requested
+        # a few at a time and consumed in order until one reaches past the cutoff.
+        payload = fetch_page(session, {**base_params, "page": "1"})
+        pagination = payload.get("pagination") or {}
+        total_pages = pagination.get("total_pages") or 1
+        if extend_recent(results, payload) and total_pages > 1:
+            pool = ThreadPoolExecutor(max_workers=PAGE_WORKERS)
+            try:
+                def submit(page):
+                    return pool.submit(fetch_page, session, {**base_params, "page": str(page)})
+
+                # Sliding window: keep PAGE_WORKERS pages in flight and only
+                # request the next one as each page is consumed in order.
+                remaining = iter(range(2, total_pages + 1))
+                window = deque(submit(p) for p in islice(remaining, PAGE_WORKERS))
+                while window:
+                    if not extend_recent(results, window.popleft().result()):
+                        break
+                    next_page = next(remaining, None)
+                    if next_page is not None:
+                        window.append(submit(next_page))
+            finally:
+                # Wait for in-flight pages so none outlive the session
+                pool.shutdown(wait=True, cancel_futures=True)
+    except requests.exceptions.HTTPError as e:
+        # 429/5xx have already been retried with backoff by the session adapter
+        print(f"HTTP error {e.response.status_code} for zip {zip_code} after retries. Skipping this zip code.")
+    except Exception as e:
+        print(f"Error fetching data for zip {zip_code}: {str(e)}. Skipping this zip code.")
     return results
 
-def fetch_all_animals():
-    token = get_token()
-    all_animals = {}
-    with requests.Session() as session:
-        for z in ZIP_CODES:
-            animals = collect_animals_for_zip(session, token, z)
-            for a in animals:
-                if not within_24_hours(a.get("published_at", "")):
-                    continue
-                if breed_excluded(a.get("breeds", {}) or {}):
-                    continue
-                aid = a.get("id")
-                if aid is not None and aid not in all_animals:
-                    all_animals[aid] = a
-    sorted_animals = sorted(
-        all_animals.values(),
-        key=lambda x: parse_dt(x.get("published_at", "")) or datetime.fromtimestamp(0, tz=timezone.utc),
-        reverse=True,
-    )
-    return sorted_animals
+def published_key(a: dict) -> datetime:
+    """Merge key for listings kept by recent_prefix.
+
+    recent_prefix only keeps listings whose published_at parses to an aware
+    datetime, so this is always the real timestamp and never a placeholder
+    that could sit out of order. parse_dt's cache makes the re-parse free.
+    """
+    return parse_dt(a["published_at"])
+
+def fetch_all_animals(session):
+    with ThreadPoolExecutor(max_workers=len(ZIP_CODES)) as pool:
+        per_zip = list(pool.map(lambda z: collect_animals_for_zip(session, z), ZIP_CODES))
+
+    # Each zip's results are already newest first (sort=recent), so a k-way
+    # merge yields the combined list in order without a full sort. Overlapping
+    # zip radii return the same dogs; drop repeats before spending any breed
+    # matching on them.
+    seen_ids = set()
+    all_animals = []
+    for a in heapq.merge(*per_zip, key=published_key, reverse=True):
+        aid = a.get("id")
+        if aid is None or aid in seen_ids:
+            continue
+        seen_ids.add(aid)
+        # collect_animals_for_zip already dropped everything past the cutoff
+        if breed_excluded(a.get("breeds", {}) or {}):
+            continue
+        all_animals.append(Animal.from_api(a, published_key(a)))
+    return all_animals
 
 def pick_photo(animal: dict):
     """Return (thumb_url, full_url) if available, else (None, None)."""
@@ -317,74 +664,96 @@ def pick_photo(animal: dict):
     return (thumb, full)
 
 
-def build_html_table(animals, top_dogs_html=""):
-    # Final column order:
-    # Published At | Name | Image | Breeds | Size | Age | Gender | Description | URL
-    headers = [
-        "Published At", "Name", "Image", "Breeds", "Size", "Age", "Gender", "Description", "URL"
-    ]
-
-    def join_breeds(b):
-        parts = []
-        if isinstance(b, dict):
-            for k in ("primary", "secondary"):
-                v = b.get(k)
-                if isinstance(v, str) and v.strip():
-                    parts.append(v.strip())
-        return ", ".join(parts) if parts else ""
+# Same replacements as html.escape(quote=True), applied in a single translate pass
+_ESCAPE_TABLE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&#x27;",
+})
+
+# Petfinder's closed enums for size/age/gender; none contain markup characters
+_SAFE_ENUM_VALUES = frozenset({
+    "Small", "Medium", "Large", "Extra Large",
+    "Baby", "Young", "Adult", "Senior",
+    "Male", "Female", "Unknown",
+})
+
+def escape_html(s: str) -> str:
+    return s.translate(_ESCAPE_TABLE)
+
+def enum_cell(value: str) -> str:
+    """Pass known Petfinder enum values through untouched; escape anything else."""
+    return value if value in _SAFE_ENUM_VALUES else escape_html(value)
+
+_WS_RE = re.compile(r"\s+")
+
+# Final column order:
+# Published At | Name | Image | Breeds | Size | Age | Gender | Description | URL
+_HEADERS = (
+    "Published At", "Name", "Image", "Breeds", "Size", "Age", "Gender", "Description", "URL"
+)
+_THEAD_HTML = (
+    '<thead style="background:#f5f5f5;"><tr>'
+    + "".join(f"<th style='text-align:left;'>{h}</th>" for h in _HEADERS)
+    + "</tr></thead>"
+)
+# One <td> per column; filled positionally with str.format
+_ROW_TMPL = "<tr>" + "<td>{}</td>" * len(_HEADERS) + "</tr>"
+
+
+def join_breeds(b):
+    parts = []
+    if isinstance(b, dict):
+        for k in ("primary", "secondary"):
+            v = b.get(k)
+            if isinstance(v, str) and v.strip():
+                parts.append(v.strip())
+    return ", ".join(parts) if parts else ""
+
+
+def _render_row(a: Animal) -> str:
+    """Render one animal as a <tr> in the digest table's column order."""
+    # Image (thumbnail linking to full-size)
+    image_cell = (
+        f'<a href="{escape_html(a.photo_full)}" target="_blank" rel="noopener">'
+        f'<img src="{escape_html(a.photo_thumb)}" alt="photo" style="height:64px;width:auto;border-radius:6px;"/></a>'
+        if a.photo_thumb else ""
+    )
 
-    rows_html = []
-    for a in animals:
-        # Core fields
-        name = a.get("name", "") or ""
-        size = a.get("size", "") or ""
-        breeds = join_breeds(a.get("breeds", {}) or {})
-        age = a.get("age", "") or ""
-        gender = a.get("gender", "") or ""
-        desc_raw = a.get("description", "") or ""
-        desc = html.escape(" ".join(desc_raw.split()))[:600]
-
-        # Image (thumbnail linking to full-size)
-        thumb, full_img = pick_photo(a)
-        image_cell = (
-            f'<a href="{html.escape(full_img)}" target="_blank" rel="noopener">'
-            f'<img src="{html.escape(thumb)}" alt="photo" style="height:64px;width:auto;border-radius:6px;"/></a>'
-            if thumb else ""
-        )
+    # Listing URL
+    url_cell = f'<a href="{escape_html(a.url)}">Link</a>' if a.url else ""
+
+    # Cells order MUST match _HEADERS order
+    cells = [
+        escape_html(to_eastern_str(a.published)),   # Published At first
+        escape_html(a.name),
+        image_cell,
+        escape_html(a.breeds),
+        enum_cell(a.size),
+        enum_cell(a.age),
+        enum_cell(a.gender),
+        # Truncate before escaping so discarded text is never escaped and
+        # the cut can't land inside an entity
+        escape_html(a.description[:600]),
+        url_cell,
+    ]
+    return _ROW_TMPL.format(*cells)
 
-        # Published At (Eastern), now first column
-        pub = parse_dt(a.get("published_at", "")) or None
-        published_at_str = to_eastern_str(pub)
-
-        # Listing URL
-        url = a.get("url", "") or ""
-        url_cell = f'<a href="{html.escape(url)}">Link</a>' if url else ""
-
-        # Cells order MUST match headers order
-        cells = [
-            html.escape(published_at_str),   # Published At first
-            html.escape(name),
-            image_cell,
-            html.escape(breeds),
-            html.escape(size),
-            html.escape(age),
-            html.escape(gender),
-            desc,
-            url_cell,
-        ]
-        rows_html.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
 
+def build_html_table(animals, top_dogs_html=""):
+    # Stream rows into one buffer rather than keeping a list of row strings
+    buf = io.StringIO()
+    buf.writelines(map(_render_row, animals))
     table_body = (
-        "".join(rows_html)
-        if rows_html
-        else f"<tr><td colspan='{len(headers)}'>No matching dogs in the last 6 hours.</td></tr>"
+        buf.getvalue()
+        or f"<tr><td colspan='{len(_HEADERS)}'>No matching dogs in the last 6 hours.</td></tr>"
     )
 
     table = f"""
     <table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-family:Arial,Helvetica,sans-serif;font-size:14px;line-height:1.3;width:100%;">
-      <thead style="background:#f5f5f5;">
-        <tr>{"".join(f"<th style='text-align:left;'>{h}</th>" for h in headers)}</tr>
-      </thead>
+      {_THEAD_HTML}
       <tbody>
         {table_body}
       </tbody>
@@ -415,6 +784,11 @@ def build_html_table(animals, top_dogs_html=""):
 
 
 def send_email(subject: str, html_body: str):
+    # Imported here so runs that exit early never load the mail stack
+    import smtplib
+    import ssl
+    from email.message import EmailMessage
+
     msg = EmailMessage()
     msg["Subject"] = subject
     msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
@@ -422,8 +796,18 @@ def send_email(subject: str, html_body: str):
     msg.set_content("Your email client does not support HTML. Please open in an HTML-capable email client.")
     msg.add_alternative(html_body, subtype="html")
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        server.starttls()
+    # Verify the server certificate before the password goes over the wire
+    ctx = ssl.create_default_context()
+    # Port 465 is implicit TLS, which skips the STARTTLS round-trip
+    implicit_tls = SMTP_PORT == 465
+    if implicit_tls:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=ctx)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+    # One connection and one message for every recipient
+    with server:
+        if not implicit_tls:
+            server.starttls(context=ctx)
         server.login(SMTP_USER, SMTP_PASS)
         server.send_message(msg)
 
@@ -444,7 +828,9 @@ def main():
         print(f"Missing required configuration: {', '.join(missing)}", file=sys.stderr)
         sys.exit(1)
 
-    animals = fetch_all_animals()
+    with make_session() as session:
+        session.headers["Authorization"] = f"Bearer {get_token(session)}"
+        animals = fetch_all_animals(session)
     
     # Generate top dogs recommendations using OpenAI
     print("Analyzing dogs with OpenAI...")